@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares capturing log-like output as a list of chunks against
+compressed capture: MB/s, compression ratio and memory held:
+
+    $> python benchmarks/compressed_capture.py [lines]
+"""
+import os
+import sys
+import time
+import tempfile
+
+from twisted.internet import reactor, defer
+
+from txsh.core import Command
+from txsh.buffers import lzma
+from txsh.resolvers import resolve_command
+
+LINE = '2026-10-19 12:00:{:02},{:03} INFO GET /api/items/{} 200 {}ms\n'
+
+SETTINGS = [
+    ('list of chunks', {}),
+    ('zlib 1', dict(_compress='zlib', _compress_level=1)),
+    ('zlib', dict(_compress='zlib')),
+    ('bz2', dict(_compress='bz2')),
+]
+if lzma is not None:
+    SETTINGS.append(('lzma', dict(_compress='lzma')))
+
+
+def make_log(lines):
+    f = tempfile.NamedTemporaryFile(suffix='.log', delete=False)
+    for i in xrange(lines):
+        f.write(LINE.format(i % 60, i % 1000, i, i % 97))
+    f.close()
+    return f.name
+
+
+@defer.inlineCallbacks
+def main(lines):
+    cat = Command(resolve_command('cat'))
+    path = make_log(lines)
+    print 'cat {} ({:,} bytes)'.format(path, os.path.getsize(path))
+
+    print '{:<16} {:>10} {:>8} {:>12} {:>12}'.format(
+        'capture', 'MB/s', 'ratio', 'memory', 'saved')
+    for name, kwargs in SETTINGS:
+        started = time.time()
+        output = yield cat(path, **kwargs)
+        elapsed = time.time() - started
+
+        stdout = output.stdout
+        if isinstance(stdout, str):
+            print '{:<16} {:>10.1f} {:>8} {:>12} {:>12}'.format(
+                name, len(stdout) / elapsed / (1024 * 1024), '-', '-', '-')
+            continue
+
+        stats = stdout.stats()
+        print '{:<16} {:>10.1f} {:>8.1f} {:>12,} {:>12,}'.format(
+            name, stats['raw_size'] / elapsed / (1024 * 1024),
+            stats['ratio'], stats['memory'], stats['memory_saved'])
+
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    def run():
+        d = main(lines)
+        d.addErrback(lambda failure: failure.printTraceback())
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(run)
+    reactor.run()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures MB/s and parent CPU seconds per GB when capturing and piping
+a bulk producer with different pipe settings:
+
+    $> python benchmarks/pipe_throughput.py [megabytes]
+"""
+import sys
+import time
+import resource
+
+from twisted.internet import reactor, defer
+
+from txsh.core import Command
+from txsh.resolvers import resolve_command
+
+SETTINGS = [
+    ('default', {}),
+    ('read 64K', dict(_read_size=64 * 1024)),
+    ('pipe 1M, read 1M', dict(_pipe_size=1024 * 1024,
+                              _read_size=1024 * 1024)),
+    ('adaptive', dict(_adaptive=True)),
+]
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+@defer.inlineCallbacks
+def measure(name, run, size):
+    started, cpu = time.time(), cpu_time()
+    output = yield run()
+    elapsed, cpu = time.time() - started, cpu_time() - cpu
+
+    assert len(output.stdout) == size, len(output.stdout)
+    mb = size / float(1024 * 1024)
+    print '{:<20} {:>10.1f} MB/s {:>10.2f} CPU s/GB   {}'.format(
+        name, mb / elapsed, cpu * 1024 / mb, output.pipes)
+
+
+@defer.inlineCallbacks
+def main(size):
+    count = str(size)
+    head = Command(resolve_command('head'))
+    cat = Command(resolve_command('cat'))
+
+    print 'capture: head -c {} /dev/zero'.format(size)
+    for name, kwargs in SETTINGS:
+        yield measure(
+            name, lambda: head('-c', count, '/dev/zero', **kwargs), size)
+
+    print
+    print 'piping: cat(head -c {} /dev/zero)'.format(size)
+    for name, kwargs in SETTINGS:
+        yield measure(
+            name,
+            lambda: cat(head('-c', count, '/dev/zero', **kwargs), **kwargs),
+            size)
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1] if len(sys.argv) > 1 else 256) * 1024 * 1024
+
+    def run():
+        d = main(size)
+        d.addErrback(lambda failure: failure.printTraceback())
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(run)
+    reactor.run()
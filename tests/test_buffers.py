@@ -0,0 +1,288 @@
+import os
+import zlib
+
+from twisted.trial import unittest
+from twisted.internet.main import CONNECTION_DONE
+
+from txsh.buffers import (
+    PipeReader, CompressedBuffer, DecompressingProducer, get_pipe_size,
+    set_pipe_size, max_pipe_size, DEFAULT_READ_SIZE, lzma)
+
+
+class FakeReader(object):
+    def __init__(self, fd):
+        self.fd = fd
+        self.received = []
+
+    def fileno(self):
+        return self.fd
+
+    def dataReceived(self, data):
+        self.received.append(data)
+
+
+class TestPipeSize(unittest.TestCase):
+    def setUp(self):
+        self.r, self.w = os.pipe()
+        self.addCleanup(os.close, self.r)
+        self.addCleanup(os.close, self.w)
+        if get_pipe_size(self.r) is None:
+            raise unittest.SkipTest("Pipes can't be resized here.")
+
+    def test_set_pipe_size(self):
+        self.assertEqual(set_pipe_size(self.r, 256 * 1024), 256 * 1024)
+        self.assertEqual(get_pipe_size(self.r), 256 * 1024)
+
+    def test_set_pipe_size_is_capped(self):
+        size = set_pipe_size(self.r, max_pipe_size() * 4)
+        self.assertEqual(size, max_pipe_size())
+
+
+class TestPipeReader(unittest.TestCase):
+    def setUp(self):
+        self.r, self.w = os.pipe()
+        self.addCleanup(os.close, self.r)
+        self.addCleanup(os.close, self.w)
+        self.reader = FakeReader(self.r)
+
+    def test_replaces_doRead(self):
+        pipe_reader = PipeReader(self.reader)
+        self.assertEqual(self.reader.doRead, pipe_reader.doRead)
+        self.assertEqual(pipe_reader.read_size, DEFAULT_READ_SIZE)
+
+    def test_read_size(self):
+        pipe_reader = PipeReader(self.reader, read_size=4)
+        os.write(self.w, "0123456789")
+        pipe_reader.doRead()
+        self.assertEqual(self.reader.received, ["0123"])
+
+    def test_connection_done(self):
+        r, w = os.pipe()
+        os.close(w)
+        self.addCleanup(os.close, r)
+        pipe_reader = PipeReader(FakeReader(r))
+        self.assertEqual(pipe_reader.doRead(), CONNECTION_DONE)
+
+    def test_adaptive_grows_when_saturated(self):
+        pipe_reader = PipeReader(self.reader, read_size=4, adaptive=True)
+        os.write(self.w, "0123456789")
+        pipe_reader.doRead()
+        self.assertEqual(pipe_reader.read_size, 8)
+        pipe_reader.doRead()
+        self.assertEqual(pipe_reader.read_size, 8)
+        self.assertEqual(self.reader.received, ["0123", "456789"])
+
+    def test_adaptive_stops_at_max(self):
+        pipe_reader = PipeReader(self.reader, adaptive=True)
+        pipe_reader.read_size = pipe_reader.max_size
+        pipe_reader.grow()
+        self.assertEqual(pipe_reader.read_size, pipe_reader.max_size)
+
+    def test_rejects_bad_sizes(self):
+        for size in [0, -1, 'x', 1.5, True]:
+            self.assertRaises(
+                ValueError, PipeReader, self.reader, read_size=size)
+            self.assertRaises(
+                ValueError, PipeReader, self.reader, pipe_size=size)
+
+    def test_read_size_is_capped(self):
+        pipe_reader = PipeReader(self.reader, read_size=10 ** 12)
+        self.assertEqual(pipe_reader.read_size, max_pipe_size())
+        self.assertEqual(pipe_reader.settings()['read_size'], max_pipe_size())
+
+    def test_settings(self):
+        pipe_reader = PipeReader(self.reader, read_size=4, adaptive=True)
+        settings = pipe_reader.settings()
+        self.assertEqual(settings['read_size'], 4)
+        self.assertTrue(settings['adaptive'])
+        self.assertEqual(settings['pipe_size'], get_pipe_size(self.r))
+
+
+class TestCompressedBuffer(unittest.TestCase):
+    lines = ["2026-10-19 12:00:{:02} INFO request served\n".format(i % 60)
+             for i in range(5000)]
+
+    def fill(self, buf):
+        for line in self.lines:
+            buf.write(line)
+        buf.close()
+        return buf
+
+    def test_roundtrip(self):
+        for codec in ['zlib', 'bz2']:
+            buf = self.fill(CompressedBuffer(codec))
+            self.assertEqual(str(buf), ''.join(self.lines))
+            self.assertEqual(buf.read(), ''.join(self.lines))
+            self.assertEqual(len(buf), len(''.join(self.lines)))
+
+    def test_lzma(self):
+        if lzma is None:
+            self.assertRaises(ValueError, CompressedBuffer, 'lzma')
+            return
+        buf = self.fill(CompressedBuffer('lzma'))
+        self.assertEqual(buf.read(), ''.join(self.lines))
+
+    def test_iterates_lazily(self):
+        # Random data doesn't compress, so zlib emits many chunks.
+        data = [os.urandom(64 * 1024) for _ in range(8)]
+        buf = CompressedBuffer('zlib', 1)
+        for chunk in data:
+            buf.write(chunk)
+        buf.close()
+
+        calls = []
+
+        class CountingDecompressor(object):
+            def __init__(self):
+                self.decompressor = zlib.decompressobj()
+
+            @property
+            def unconsumed_tail(self):
+                return self.decompressor.unconsumed_tail
+
+            def decompress(self, chunk, max_length=0):
+                calls.append(len(chunk))
+                return self.decompressor.decompress(chunk, max_length)
+
+            def flush(self):
+                return self.decompressor.flush()
+
+        buf._decompressor = CountingDecompressor
+        chunks = iter(buf)
+        self.assertEqual(calls, [])
+        first = next(chunks)
+        self.assertEqual(len(calls), 1)
+        second = next(chunks)
+        self.assertEqual(len(calls), 2)
+
+        rest = list(chunks)
+        self.assertTrue(len(calls) > 2)
+        self.assertEqual(''.join([first, second] + rest), ''.join(data))
+
+    def test_pieces_are_bounded(self):
+        for codec in ['zlib', 'lzma']:
+            if codec == 'lzma' and lzma is None:
+                continue
+            buf = CompressedBuffer(codec)
+            for _ in range(128):
+                buf.write('\0' * 64 * 1024)
+            buf.close()
+
+            # A single compressed chunk holds far more than a piece.
+            self.assertTrue(
+                buf.raw_size / len(buf._chunks) > 4 * buf.piece_size)
+            pieces = [len(piece) for piece in buf]
+            self.assertTrue(len(pieces) > 4)
+            self.assertTrue(max(pieces) <= buf.piece_size)
+            self.assertEqual(sum(pieces), buf.raw_size)
+
+    def test_stats(self):
+        buf = self.fill(CompressedBuffer())
+        self.assertTrue(buf.ratio > 10)
+        self.assertTrue(buf.memory_saved > 0)
+        self.assertTrue(buf.memory < buf.raw_size)
+        self.assertEqual(buf.stats()['codec'], 'zlib')
+
+    def test_empty(self):
+        for codec in ['zlib', 'bz2']:
+            buf = CompressedBuffer(codec)
+            buf.close()
+            self.assertEqual(buf.read(), '')
+            self.assertEqual(buf.compressed_size, 0)
+            self.assertEqual(buf.ratio, 1.0)
+            self.assertEqual(buf.memory_saved, 0)
+
+    def test_small(self):
+        buf = CompressedBuffer()
+        buf.write('hi\n')
+        buf.close()
+        self.assertEqual(buf.read(), 'hi\n')
+        self.assertTrue(0 < buf.ratio < 1)
+        self.assertTrue(buf.memory_saved < 0)
+
+    def test_closed(self):
+        buf = CompressedBuffer()
+        self.assertRaises(ValueError, buf.read)
+        buf.close()
+        buf.close()
+        self.assertRaises(ValueError, buf.write, 'data')
+
+    def test_bad_level(self):
+        for level in [0, 10]:
+            self.assertRaises(ValueError, CompressedBuffer, 'bz2', level)
+        self.assertRaises(ValueError, CompressedBuffer, 'zlib', 42)
+        self.assertEqual(CompressedBuffer('bz2', 1).codec, 'bz2')
+
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, CompressedBuffer, 'zip')
+
+
+class RecordingConsumer(object):
+    def __init__(self):
+        self.calls = []
+        self.producer = None
+
+    def registerProducer(self, producer, streaming):
+        self.calls.append(('register', streaming))
+        self.producer = producer
+        producer.resumeProducing()
+
+    def unregisterProducer(self):
+        self.calls.append(('unregister',))
+        self.producer = None
+
+    def write(self, data):
+        self.calls.append(('write', data))
+
+    def closeStdin(self):
+        self.calls.append(('closeStdin',))
+
+
+class TestDecompressingProducer(unittest.TestCase):
+    def setUp(self):
+        self.data = [os.urandom(64 * 1024) for _ in range(4)]
+        self.buf = CompressedBuffer('zlib', 1)
+        for chunk in self.data:
+            self.buf.write(chunk)
+        self.buf.close()
+        self.consumer = RecordingConsumer()
+
+    def written(self):
+        return ''.join(call[1] for call in self.consumer.calls
+                       if call[0] == 'write')
+
+    def test_one_chunk_per_pull(self):
+        producer = DecompressingProducer(
+            self.buf, self.consumer, done=self.consumer.closeStdin)
+        producer.start()
+        self.assertEqual(self.consumer.calls[0], ('register', False))
+        self.assertEqual(len(self.consumer.calls), 2)
+        self.assertEqual(self.consumer.calls[1][0], 'write')
+
+        producer.resumeProducing()
+        self.assertEqual(len(self.consumer.calls), 3)
+
+        while self.consumer.producer is not None:
+            producer.resumeProducing()
+        self.assertEqual(self.consumer.calls[-2:],
+                         [('unregister',), ('closeStdin',)])
+        self.assertEqual(self.written(), ''.join(self.data))
+        self.assertTrue(producer.finished)
+
+        producer.resumeProducing()
+        self.assertEqual(self.consumer.calls[-1], ('closeStdin',))
+
+    def test_empty(self):
+        buf = CompressedBuffer()
+        buf.close()
+        DecompressingProducer(
+            buf, self.consumer, done=self.consumer.closeStdin).start()
+        self.assertEqual(self.consumer.calls, [
+            ('register', False), ('unregister',), ('closeStdin',)])
+
+    def test_stopProducing(self):
+        producer = DecompressingProducer(self.buf, self.consumer)
+        producer.start()
+        producer.stopProducing()
+        producer.resumeProducing()
+        self.assertEqual(len(self.consumer.calls), 2)
@@ -63,6 +63,29 @@ class TestCommand(unittest.TestCase):
         git_branch_verbose = git_branch.bake("-v")
         self.assertEqual(str(git_branch_verbose), "git branch -v")
 
+    def test_defaults(self):
+        mock_spawn = MagicMock()
+        Command._spawn = mock_spawn
+        cmd = Command('ls', defaults={'_nice': 10, '_ionice': 'idle'})
+        cmd.bake('-l')('-h', _nice=5)
+        placement = mock_spawn.call_args[1]['placement']
+        self.assertEqual(mock_spawn.call_args[0][1], ["ls", "-h", "-l"])
+        self.assertEqual(placement.nice, 5)
+        self.assertEqual(placement.ionice, 'idle')
+
+        cmd.branch()
+        placement = mock_spawn.call_args[1]['placement']
+        self.assertEqual(placement.nice, 10)
+
+    def test_rejects_bad_pipe_settings(self):
+        mock_spawn = MagicMock()
+        Command._spawn = mock_spawn
+        cmd = Command('ls')
+        for size in [0, -1, 'x', True]:
+            self.assertRaises(ValueError, cmd, _read_size=size)
+            self.assertRaises(ValueError, cmd, _pipe_size=size)
+        self.assertFalse(mock_spawn.called)
+
     def test_subcommand(self):
         cmd = Command("git")
         git_branch = cmd.branch
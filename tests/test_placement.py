@@ -0,0 +1,148 @@
+import sys
+import resource
+
+from mock import patch
+from twisted.trial import unittest
+from twisted.internet import defer, reactor
+
+from txsh.protocols import TxShProcessProtocol
+from txsh.placement import (
+    Placement, RoundRobinCores, ioprio_value, rlimit_resource,
+    available_cores, spawnPlacedProcess, CPU_SETSIZE)
+
+# `from txsh import placement` would resolve to a Command.
+placement = sys.modules[Placement.__module__]
+
+
+class TestRoundRobinCores(unittest.TestCase):
+    def test_next(self):
+        cores = RoundRobinCores([0, 1, 2, 3], reserve=1)
+        self.assertEqual(cores.reserved, [0])
+        assigned = [cores.next() for _ in range(4)]
+        self.assertEqual(assigned, [[1], [2], [3], [1]])
+
+    def test_per_process(self):
+        cores = RoundRobinCores([0, 1, 2, 3, 4], reserve=1, per_process=2)
+        self.assertEqual(cores.next(), [1, 2])
+        self.assertEqual(cores.next(), [3, 4])
+
+    def test_nothing_left(self):
+        self.assertRaises(ValueError, RoundRobinCores, [0, 1], reserve=2)
+
+
+class TestPlacement(unittest.TestCase):
+    def test_ioprio_value(self):
+        self.assertEqual(ioprio_value('idle'), 3 << 13)
+        self.assertEqual(ioprio_value(('best-effort', 7)), (2 << 13) | 7)
+        self.assertRaises(ValueError, ioprio_value, 'fast')
+
+    def test_rlimit_resource(self):
+        self.assertEqual(rlimit_resource('as'), resource.RLIMIT_AS)
+        self.assertEqual(rlimit_resource('open_files'), resource.RLIMIT_NOFILE)
+        self.assertEqual(rlimit_resource('cpu_seconds'), resource.RLIMIT_CPU)
+        self.assertRaises(ValueError, rlimit_resource, 'bananas')
+
+    def test_validates_in_parent(self):
+        self.assertRaises(ValueError, Placement, ionice='fast')
+        self.assertRaises(ValueError, Placement, ionice=('idle', 8))
+        self.assertRaises(ValueError, Placement, rlimits={'bananas': 1})
+        self.assertRaises(ValueError, Placement, rlimits={'nofile': 'x'})
+        self.assertRaises(ValueError, Placement, rlimits={'nofile': (1,)})
+        self.assertRaises(ValueError, Placement,
+                          rlimits={'nofile': (1, 'x')})
+        self.assertRaises(ValueError, Placement, cpu_affinity=[9999])
+        self.assertRaises(ValueError, Placement, cpu_affinity=[-1])
+        self.assertRaises(ValueError, Placement, cpu_affinity=['0'])
+        self.assertRaises(ValueError, Placement, cpu_affinity=[])
+        self.assertRaises(ValueError, Placement, cpu_affinity=3)
+        self.assertRaises(ValueError, Placement, nice='10')
+        self.assertRaises(ValueError, Placement, nice=True)
+        self.assertRaises(ValueError, Placement, ionice=('idle', True))
+        self.assertRaises(ValueError, Placement, rlimits={'nofile': True})
+        self.assertRaises(ValueError, Placement, cpu_affinity=[False])
+
+        # longs are as good as ints.
+        placement = Placement(nice=long(1), ionice=('idle', long(0)),
+                              rlimits={'nofile': long(64)},
+                              cpu_affinity=[long(0)])
+        self.assertEqual(placement.nice, 1)
+
+    def test_available_cores(self):
+        try:
+            with open('/proc/self/status') as f:
+                lines = [line for line in f
+                         if line.startswith('Cpus_allowed_list:')]
+        except IOError:
+            raise unittest.SkipTest('No /proc/self/status here.')
+
+        expected = []
+        for part in lines[0].split(':')[1].strip().split(','):
+            first, _, last = part.partition('-')
+            expected.extend(range(int(first), int(last or first) + 1))
+        self.assertEqual(available_cores(), expected)
+
+    def test_is_empty(self):
+        self.assertFalse(Placement())
+        self.assertTrue(Placement(nice=0))
+
+    def test_resolves_round_robin(self):
+        cores = RoundRobinCores([0, 1, 2], reserve=1)
+        self.assertEqual(Placement(cpu_affinity=cores).cpu_affinity, [1])
+        self.assertEqual(Placement(cpu_affinity=cores).cpu_affinity, [2])
+
+    @patch.object(placement, 'set_rlimits')
+    @patch.object(placement, 'set_ionice')
+    @patch.object(placement.os, 'nice')
+    @patch.object(placement, 'set_cpu_affinity')
+    def test_apply(self, set_cpu_affinity, nice, set_ionice, set_rlimits):
+        Placement(cpu_affinity=[1], nice=10, ionice='idle',
+                  rlimits={'cpu': 60}).apply()
+        set_cpu_affinity.assert_called_once_with([1])
+        nice.assert_called_once_with(10)
+        set_ionice.assert_called_once_with(
+            placement.ioprio_syscall(), 3 << 13)
+        set_rlimits.assert_called_once_with(
+            [(resource.RLIMIT_CPU, (60, 60))])
+
+        set_cpu_affinity.reset_mock()
+        Placement(nice=10).apply()
+        self.assertFalse(set_cpu_affinity.called)
+
+
+class TestPlacedProcess(unittest.TestCase):
+    """Spawns real processes, so what runs between fork and exec is
+    exercised for real.
+    """
+    def spawn(self, args, **placement):
+        proto = TxShProcessProtocol()
+        spawnPlacedProcess(
+            reactor, Placement(**placement), proto, args[0], args, None)
+        return proto._process_deferred
+
+    @defer.inlineCallbacks
+    def test_spawn(self):
+        core = available_cores()[0]
+        script = ('grep Cpus_allowed_list /proc/self/status; '
+                  'ulimit -n; ulimit -t')
+        # Several runs: the child used to crash only now and then.
+        for _ in range(5):
+            output = yield self.spawn(
+                ['/bin/sh', '-c', script], cpu_affinity=[core], nice=1,
+                ionice=('best-effort', 7),
+                rlimits={'nofile': 64, 'cpu_seconds': 100})
+            self.assertEqual(output.stderr, '')
+            self.assertEqual(output.status, 0)
+            self.assertEqual(
+                output.stdout,
+                'Cpus_allowed_list:\t{}\n64\n100\n'.format(core))
+
+    @defer.inlineCallbacks
+    def test_failure_in_child(self):
+        # A core outside our own mask can't be set, even by root.
+        core = available_cores()[-1] + 1
+        if core >= CPU_SETSIZE:
+            raise unittest.SkipTest('Every core is available.')
+
+        output = yield self.spawn(['/bin/true'], cpu_affinity=[core])
+        self.assertEqual(output.status, 1)
+        self.assertIn('OSError', output.stderr)
@@ -1,8 +1,11 @@
+import os
+
 from mock import MagicMock
 from twisted.trial import unittest
 from twisted.internet import defer
 
 from txsh.protocols import TxShProcessProtocol, DeferredProcess
+from txsh.buffers import CompressedBuffer
 
 
 class TestTxShProcessProtocol(unittest.TestCase):
@@ -55,6 +58,83 @@ class TestTxShProcessProtocol(unittest.TestCase):
         proto.write_to_stderr("data!")
         d.put.assert_called_once_with("data!")
 
+    def test_tune_pipes(self):
+        proto = TxShProcessProtocol()
+        proto.transport = MagicMock()
+        proto.connectionMade()
+        self.assertEqual(proto._pipe_readers, {})
+        self.assertIsNone(proto.get_pipe_settings())
+
+        r, w = os.pipe()
+        self.addCleanup(os.close, r)
+        self.addCleanup(os.close, w)
+        reader = MagicMock()
+        reader.fileno.return_value = r
+
+        proto = TxShProcessProtocol(read_size=65536)
+        proto.transport = MagicMock()
+        proto.transport.pipes = {1: reader}
+        proto.connectionMade()
+        settings = proto.get_pipe_settings()
+        self.assertEqual(settings.keys(), ['stdout'])
+        self.assertEqual(settings['stdout']['read_size'], 65536)
+
+    def test_output_reports_pipes(self):
+        proto = TxShProcessProtocol()
+        proto._status = 0
+        proto._pipe_readers = {'stdout': MagicMock()}
+        proto._pipe_readers['stdout'].settings.return_value = {'x': 1}
+        d = proto._process_deferred
+        proto.processEnded(None)
+        output = self.successResultOf(d)
+        self.assertEqual(output.pipes, {'stdout': {'x': 1}})
+        status, stdout, stderr = output
+        self.assertEqual(status, 0)
+
+        replaced = output._replace(status=1)
+        self.assertEqual(replaced.status, 1)
+        self.assertEqual(replaced.pipes, {'stdout': {'x': 1}})
+        self.assertEqual(replaced._replace(pipes=None).pipes, None)
+        made = TxShProcessProtocol.Output._make([0, '', ''], pipes={})
+        self.assertEqual(made.pipes, {})
+        self.assertIsNone(TxShProcessProtocol.Output._make([0, '', '']).pipes)
+
+    def test_compressed_capture(self):
+        proto = TxShProcessProtocol(compress=True)
+        self.assertIsInstance(proto._stdout, CompressedBuffer)
+        self.assertEqual(proto._stdout.codec, 'zlib')
+        proto.outReceived("data!")
+        proto.errReceived("oops")
+        d = proto._process_deferred
+        proto.processEnded(None)
+        output = self.successResultOf(d)
+        self.assertEqual(str(output.stdout), "data!")
+        self.assertEqual(str(output.stderr), "oops")
+
+        proto = TxShProcessProtocol(compress='bz2', stdout=[])
+        self.assertEqual(proto._stdout, [])
+        self.assertEqual(proto._stderr.codec, 'bz2')
+
+    def test_compressed_stdin(self):
+        buf = CompressedBuffer()
+        buf.write("data!")
+        buf.close()
+        proto = TxShProcessProtocol(stdin=buf)
+        proto.transport = MagicMock()
+        proto.connectionMade()
+
+        # Nothing is written up front, the transport pulls it.
+        self.assertFalse(proto.transport.write.called)
+        self.assertFalse(proto.transport.closeStdin.called)
+        producer, streaming = proto.transport.registerProducer.call_args[0]
+        self.assertFalse(streaming)
+
+        producer.resumeProducing()
+        proto.transport.write.assert_called_once_with("data!")
+        producer.resumeProducing()
+        proto.transport.unregisterProducer.assert_called_once_with()
+        proto.transport.closeStdin.assert_called_once_with()
+
 
 class TestDeferredProcess(unittest.TestCase):
     def test_signal(self):
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import bz2
+import zlib
+import errno
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from zope.interface import implementer
+from twisted.internet.interfaces import IPullProducer
+from twisted.internet.main import CONNECTION_DONE, CONNECTION_LOST
+
+# Linux only. Older Pythons don't expose them in the fcntl module.
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+F_GETPIPE_SZ = getattr(fcntl, 'F_GETPIPE_SZ', 1032)
+
+# This is what twisted.internet.fdesc.readFromFD reads at a time.
+DEFAULT_READ_SIZE = 8192
+
+# Used when /proc/sys/fs/pipe-max-size can't be read.
+DEFAULT_MAX_PIPE_SIZE = 1024 * 1024
+
+
+def max_pipe_size():
+    """Returns the biggest pipe buffer an unprivileged process
+    may ask for.
+    """
+    try:
+        with open('/proc/sys/fs/pipe-max-size') as f:
+            return int(f.read())
+    except (IOError, ValueError):
+        return DEFAULT_MAX_PIPE_SIZE
+
+
+def check_size(name, size):
+    """Returns `size`, or raises ValueError if it is not a positive int.
+
+    :param name: What to call it in the error, e.g: '_read_size'.
+    :param size: A size in bytes.
+    """
+    if (not isinstance(size, (int, long)) or isinstance(size, bool) or
+            size <= 0):
+        raise ValueError('{} must be a positive int, got {!r}'.format(
+            name, size))
+    return size
+
+
+def get_pipe_size(fd):
+    """Returns the size of the pipe buffer behind `fd` or None if
+    the platform can't tell.
+
+    :param fd: A pipe file descriptor.
+    """
+    if fcntl is None:
+        return None
+
+    try:
+        return fcntl.fcntl(fd, F_GETPIPE_SZ)
+    except (IOError, OSError):
+        return None
+
+
+def set_pipe_size(fd, size):
+    """Resizes the pipe buffer behind `fd` and returns the size the
+    kernel actually gave us (it rounds up to a power of two pages).
+    The request is capped at `max_pipe_size`. Returns None if the
+    platform does not support resizing pipes.
+
+    :param fd: A pipe file descriptor.
+    :param size: The wanted size in bytes.
+    """
+    if fcntl is None:
+        return None
+
+    size = min(size, max_pipe_size())
+    try:
+        fcntl.fcntl(fd, F_SETPIPE_SZ, size)
+    except (IOError, OSError):
+        pass
+
+    return get_pipe_size(fd)
+
+
+class PipeReader(object):
+    """Replaces the `doRead` of a Twisted `ProcessReader` so we can
+    choose how much is read from the pipe on every reactor wakeup
+    (Twisted always reads 8192 bytes) and how big the pipe buffer is.
+
+    In adaptive mode every read that fills the whole read buffer means
+    the child is producing faster than we drain it, so the read size
+    is doubled and the pipe grown to match, up to `max_pipe_size`.
+    """
+    def __init__(self, reader, pipe_size=None, read_size=None,
+                 adaptive=False):
+        """
+        :param reader: A `ProcessReader` from `transport.pipes`.
+        :param pipe_size: Pipe buffer size in bytes (optional).
+        :param read_size: Bytes to read per wakeup (optional), capped at
+        `max_pipe_size`.
+        :param adaptive: Grow both while the stream stays saturated.
+        """
+        self.reader = reader
+        self.adaptive = adaptive
+        self.max_size = max_pipe_size()
+        self.read_size = DEFAULT_READ_SIZE
+        if read_size is not None:
+            self.read_size = min(
+                check_size('read_size', read_size), self.max_size)
+
+        if pipe_size is not None:
+            check_size('pipe_size', pipe_size)
+            self.pipe_size = set_pipe_size(reader.fileno(), pipe_size)
+        else:
+            self.pipe_size = get_pipe_size(reader.fileno())
+
+        reader.doRead = self.doRead
+
+    def doRead(self):
+        """Does what `twisted.internet.fdesc.readFromFD` does, but
+        reading `read_size` bytes at a time.
+        """
+        try:
+            data = os.read(self.reader.fileno(), self.read_size)
+        except (OSError, IOError) as e:
+            if e.args[0] in (errno.EAGAIN, errno.EINTR):
+                return
+            return CONNECTION_LOST
+
+        if not data:
+            return CONNECTION_DONE
+
+        if self.adaptive and len(data) == self.read_size:
+            self.grow()
+
+        self.reader.dataReceived(data)
+
+    def grow(self):
+        """Doubles the read size and makes sure the pipe can hold it.
+        """
+        if self.read_size >= self.max_size:
+            return
+
+        self.read_size = min(self.read_size * 2, self.max_size)
+        if self.pipe_size is not None and self.pipe_size < self.read_size:
+            self.pipe_size = set_pipe_size(
+                self.reader.fileno(), self.read_size)
+
+    def settings(self):
+        """Returns the effective settings as a dict.
+        """
+        return {
+            'pipe_size': self.pipe_size,
+            'read_size': self.read_size,
+            'adaptive': self.adaptive,
+        }
+
+
+def _zlib_compressor(level):
+    if level is None:
+        level = zlib.Z_DEFAULT_COMPRESSION
+    return zlib.compressobj(level)
+
+
+def _bz2_compressor(level):
+    return bz2.BZ2Compressor(9 if level is None else level)
+
+
+def _lzma_compressor(level):
+    if lzma is None:
+        raise ValueError('lzma needs Python 3 or backports.lzma')
+    return lzma.LZMACompressor(preset=level)
+
+
+# codec name -> (compressor factory taking a level, decompressor factory)
+CODECS = {
+    'zlib': (_zlib_compressor, zlib.decompressobj),
+    'bz2': (_bz2_compressor, bz2.BZ2Decompressor),
+    'lzma': (_lzma_compressor, lzma and lzma.LZMADecompressor),
+}
+
+# The most a decompressed piece may hold, so a small chunk of very
+# compressible data doesn't expand into megabytes at once.
+PIECE_SIZE = 256 * 1024
+
+
+def _decompress(decompressor, chunk, size):
+    """Yields `chunk` decompressed, at most `size` bytes at a time where
+    the codec allows it.
+    """
+    if hasattr(decompressor, 'unconsumed_tail'):  # zlib
+        data = decompressor.decompress(chunk, size)
+        while True:
+            if data:
+                yield data
+            # A full piece may leave output pending even with no input left.
+            if not decompressor.unconsumed_tail and len(data) < size:
+                return
+            data = decompressor.decompress(decompressor.unconsumed_tail, size)
+
+    elif hasattr(decompressor, 'needs_input'):  # lzma, bz2 on Python 3
+        data = decompressor.decompress(chunk, max_length=size)
+        while True:
+            if data:
+                yield data
+            if decompressor.eof or decompressor.needs_input:
+                return
+            data = decompressor.decompress(b'', max_length=size)
+
+    else:
+        # bz2 on Python 2 can't bound its output.
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+
+
+# What a str and a list slot cost, to estimate the memory a list of raw
+# chunks would have taken.
+_STR_OVERHEAD = sys.getsizeof('')
+_LIST_SLOT = sys.getsizeof([None]) - sys.getsizeof([])
+
+
+class CompressedBuffer(object):
+    """Captures a stream compressed, chunk by chunk as it arrives,
+    instead of keeping the raw chunks in a list. It is file-like, so
+    the protocol writes to it and closes it like any other stream, and
+    it is what you get back as stdout/stderr:
+
+        >>> output.stdout.ratio
+        >>> for chunk in output.stdout:  # Decompressed lazily
+        ...     f.write(chunk)
+        >>> str(output.stdout)  # Everything, decompressed
+
+    Iterating yields pieces of at most `piece_size` bytes, except with bz2
+    on Python 2 where a piece is a whole decompressed chunk.
+    """
+    piece_size = PIECE_SIZE
+
+    def __init__(self, codec='zlib', level=None):
+        """
+        :param codec: 'zlib', 'bz2' or 'lzma' (Python 3 or backports.lzma).
+        :param level: Compression level, the codec's default if None.
+        """
+        if codec not in CODECS:
+            raise ValueError('Unknown codec: {}'.format(codec))
+
+        self.codec = codec
+        self.closed = False
+        self.raw_size = 0
+        self._raw_chunks = 0
+        self._chunks = []
+
+        compressor, self._decompressor = CODECS[codec]
+        self._compressor = compressor(level)
+
+    def write(self, data):
+        """Compresses and keeps a chunk of data.
+        """
+        if self.closed:
+            raise ValueError('Write to a closed CompressedBuffer')
+
+        self.raw_size += len(data)
+        self._raw_chunks += 1
+        self._keep(self._compressor.compress(data))
+
+    def close(self):
+        """Flushes the compressor. Nothing can be written after this.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        flushed = self._compressor.flush()
+        self._compressor = None
+        if self.raw_size:
+            # An empty capture keeps nothing, not even the codec header.
+            self._keep(flushed)
+
+    def _keep(self, compressed):
+        # Compressors often hold on to small inputs and return nothing.
+        if compressed:
+            self._chunks.append(compressed)
+
+    def __iter__(self):
+        """Yields the decompressed data in pieces of at most `piece_size`,
+        decompressing only as far as the iterator has got.
+        """
+        if not self.closed:
+            raise ValueError('CompressedBuffer is still being written')
+
+        decompressor = self._decompressor()
+        for chunk in self._chunks:
+            for data in _decompress(decompressor, chunk, self.piece_size):
+                yield data
+
+        flush = getattr(decompressor, 'flush', None)
+        if flush is not None:
+            data = flush()
+            if data:
+                yield data
+
+    def read(self):
+        """Returns everything, decompressed.
+        """
+        return ''.join(self)
+
+    __str__ = read
+
+    def __len__(self):
+        return self.raw_size
+
+    @property
+    def compressed_size(self):
+        return sum(len(chunk) for chunk in self._chunks)
+
+    @property
+    def ratio(self):
+        """Raw size over compressed size. 1.0 for an empty capture. Below
+        1.0 for small outputs, where the codec's headers outweigh what
+        compression saves.
+        """
+        if not self.raw_size or not self.compressed_size:
+            return 1.0
+        return self.raw_size / float(self.compressed_size)
+
+    @property
+    def memory(self):
+        """Estimated bytes held by the compressed chunks and their list.
+        """
+        return (sys.getsizeof(self._chunks) + self.compressed_size +
+                len(self._chunks) * _STR_OVERHEAD)
+
+    @property
+    def memory_saved(self):
+        """Estimated bytes saved against keeping the raw chunks in a list,
+        which is how uncompressed output is captured. 0 for an empty
+        capture, negative for small outputs where compression doesn't pay.
+        """
+        raw = (sys.getsizeof([]) + self.raw_size +
+               self._raw_chunks * (_STR_OVERHEAD + _LIST_SLOT))
+        return raw - self.memory
+
+    def stats(self):
+        """Returns the sizes and the ratio as a dict.
+        """
+        return {
+            'codec': self.codec,
+            'raw_size': self.raw_size,
+            'compressed_size': self.compressed_size,
+            'ratio': self.ratio,
+            'memory': self.memory,
+            'memory_saved': self.memory_saved,
+        }
+
+
+@implementer(IPullProducer)
+class DecompressingProducer(object):
+    """Feeds a `CompressedBuffer` into a consumer (the stdin of the next
+    process when piping), decompressing one piece each time the consumer
+    asks for more. Only one piece (see `CompressedBuffer.piece_size`) is
+    held at a time, instead of the whole raw output sitting in the
+    consumer's write buffer.
+    """
+    def __init__(self, buf, consumer, done=None):
+        """
+        :param buf: A closed `CompressedBuffer`.
+        :param consumer: An IConsumer, e.g. a process transport.
+        :param done: Called once everything has been written (optional).
+        """
+        self._chunks = iter(buf)
+        self._consumer = consumer
+        self._done = done
+        self.finished = False
+
+    def start(self):
+        """Registers with the consumer, which starts pulling right away.
+        """
+        self._consumer.registerProducer(self, False)
+
+    def resumeProducing(self):
+        """Writes the next decompressed chunk, or finishes.
+        """
+        if self.finished:
+            return
+
+        for chunk in self._chunks:
+            self._consumer.write(chunk)
+            return
+
+        self.finish()
+
+    def stopProducing(self):
+        """The consumer went away, e.g. the process closed its stdin.
+        """
+        self.finished = True
+        self._chunks = iter(())
+
+    def finish(self):
+        self.finished = True
+        self._consumer.unregisterProducer()
+        if self._done is not None:
+            self._done()
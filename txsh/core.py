@@ -6,6 +6,8 @@ from twisted.internet import reactor
 
 from resolvers import resolve_command, which
 from protocols import TxShProcessProtocol, DeferredProcess
+from buffers import check_size
+from placement import Placement, spawnPlacedProcess
 
 
 class Command(object):
@@ -16,15 +18,18 @@ class Command(object):
         and returns an instance with it.
 
         :param cmd: A command string.
+        :param default_kwargs: Keyword arguments every call starts with,
+        e.g: the ones given to `txsh(_nice=10)`.
         """
         cmd = resolve_command(cmd)
-        return Command(cmd)
+        return Command(cmd, defaults=default_kwargs)
 
-    def __init__(self, cmd, subcommand=None):
+    def __init__(self, cmd, subcommand=None, defaults=None):
         """
         """
         self.cmd = cmd
         self.subcommand = subcommand
+        self._defaults = defaults or {}
         self._args = []
 
     def __str__(self):
@@ -46,7 +51,7 @@ class Command(object):
         """Sugar for subcommands. This merely returns
         a new Command back with a subcommand inside.
         """
-        return Command(self.cmd, name)
+        return Command(self.cmd, name, self._defaults)
 
     def bake(self, *args, **kwargs):
         """Bakes arguments for subsequent runnings. An example:
@@ -57,7 +62,7 @@ class Command(object):
         This returns a new `Command` instance, leaving the original
         untouched.
         """
-        new_cmd = Command(self.cmd, self.subcommand)
+        new_cmd = Command(self.cmd, self.subcommand, self._defaults)
         new_cmd._bake(*args, **kwargs)
         return new_cmd
 
@@ -104,13 +109,17 @@ class Command(object):
 
         return args
 
-    def _spawn(self, protocol, args, env=None):
+    def _spawn(self, protocol, args, env=None, placement=None):
         """Returns an object which provides IProcessTransport.
 
         :param protocol: An instance of `TxShProcessProtocol`.
         :param args: The arguments to be passed into the process.
         :param env: The environment variables.
+        :param placement: A `Placement` to apply in the child (optional).
         """
+        if placement:
+            return spawnPlacedProcess(
+                reactor, placement, protocol, self.cmd, args, env)
         return reactor.spawnProcess(protocol, self.cmd, args, env=env)
 
     def _make_protocol(self, **kwargs):
@@ -141,12 +150,51 @@ class Command(object):
         :param _env: A dictionary of environment variables on which the process
         should run under. Defaults to `os.environ`.
         :param _debug: If true, debug messages will be printed.
+        :param _pipe_size: Size in bytes of the stdout/stderr pipe buffers.
+        Only honoured on Linux, capped at /proc/sys/fs/pipe-max-size.
+        :param _read_size: How many bytes to read from the pipes on each
+        reactor wakeup. Twisted reads 8192 by default.
+        :param _adaptive: If true, the read size and the pipe buffer grow
+        while the process keeps the pipe full.
+        :param _cpu_affinity: The cores the process may run on, e.g: [2, 3],
+        or a `txsh.placement.RoundRobinCores` to hand them out in turn.
+        :param _nice: A niceness increment, e.g: 10
+        :param _ionice: An I/O class ('idle', 'best-effort', 'realtime') or
+        a (class, level) tuple, e.g: ('best-effort', 7)
+        :param _rlimits: A dict of resource limits, e.g:
+        {'as': 2 * 1024 ** 3, 'nofile': 1024, 'cpu': (60, 70)}
+        :param _compress: Capture stdout and stderr compressed as they
+        arrive: True or 'zlib', 'bz2' or 'lzma'. You then receive
+        `txsh.buffers.CompressedBuffer` objects instead of strings. They
+        decompress lazily when iterated over, read() or str()'d, and report
+        their `ratio` and `memory_saved`.
+        :param _compress_level: The compression level (optional).
+
+        Defaults given to the module, e.g: `txsh(_nice=10)`, apply to every
+        call and can be overridden per call. The effective pipe settings
+        are available at `.pipes` on the result.
         """
+        kwargs = dict(self._defaults, **kwargs)
         env = kwargs.pop('_env', os.environ)
         debug = kwargs.pop('_debug', False)
         _in = kwargs.pop('_in', None)
         _out = kwargs.pop('_out', None)
         _err = kwargs.pop('_err', None)
+        pipe_kwargs = dict(
+            pipe_size=kwargs.pop('_pipe_size', None),
+            read_size=kwargs.pop('_read_size', None),
+            adaptive=kwargs.pop('_adaptive', False))
+        for name in ['pipe_size', 'read_size']:
+            if pipe_kwargs[name] is not None:
+                check_size('_' + name, pipe_kwargs[name])
+        capture_kwargs = dict(
+            compress=kwargs.pop('_compress', None),
+            compress_level=kwargs.pop('_compress_level', None))
+        placement = Placement(
+            cpu_affinity=kwargs.pop('_cpu_affinity', None),
+            nice=kwargs.pop('_nice', None),
+            ionice=kwargs.pop('_ionice', None),
+            rlimits=kwargs.pop('_rlimits', None))
 
         if self._is_string(_out):
             _out = open(_out, 'wb')
@@ -158,14 +206,18 @@ class Command(object):
             # This is a piped call.
             d = args[0]
             d.addCallback(lambda exc: exc.stdout)
-            d.addCallback(lambda stdout: self._make_protocol(stdout, debug))
+            d.addCallback(lambda stdout: self._make_protocol(
+                stdin=stdout, debug=debug,
+                **dict(pipe_kwargs, **capture_kwargs)))
             d.addCallback(
-                lambda protocol: self._spawn(protocol, [self.cmd], env))
+                lambda protocol: self._spawn(
+                    protocol, [self.cmd], env, placement=placement))
             d.addCallback(lambda process: process.proto._process_deferred)
             return d
 
         txsh_protocol = self._make_protocol(
-            stdin=_in, stdout=_out, stderr=_err, debug=debug)
+            stdin=_in, stdout=_out, stderr=_err, debug=debug,
+            **dict(pipe_kwargs, **capture_kwargs))
 
         # Twisted requires the first arg to be the command itself
         args = self.build_arguments(*args, **kwargs)
@@ -173,7 +225,7 @@ class Command(object):
         if self.subcommand:
             args.insert(1, self.subcommand)
         args.extend(self._args)
-        process = self._spawn(txsh_protocol, args, env)
+        process = self._spawn(txsh_protocol, args, env, placement=placement)
         return process.proto._process_deferred
 
 
@@ -242,7 +294,7 @@ class Environment(dict):
         if builtin:
             return builtin
 
-        return Command.factory(cmd)
+        return Command.factory(cmd, **self.baked_args)
 
     # methods that begin with "custom_" are custom builtins and will
     # override any program that exists in our path.  this is useful
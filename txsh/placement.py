@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import ctypes
+import platform
+import resource
+import itertools
+import multiprocessing
+
+from twisted.internet import process
+
+# ioprio_set(2) has no libc wrapper and its number depends on the arch.
+IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'armv7l': 314,
+    'ppc64le': 273,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASSES = {
+    'none': 0,
+    'realtime': 1,
+    'best-effort': 2,
+    'idle': 3,
+}
+
+# Shorthands for the limits people ask for the most. Any other
+# resource.RLIMIT_* can be given by its lowercase name, e.g. 'nproc'.
+RLIMIT_ALIASES = {
+    'address_space': 'as',
+    'open_files': 'nofile',
+    'cpu_seconds': 'cpu',
+}
+
+# cpu_set_t is a 1024 bit mask in glibc.
+CPU_SETSIZE = 1024
+_MASK_BITS = 8 * ctypes.sizeof(ctypes.c_ulong)
+_CpuSet = ctypes.c_ulong * (CPU_SETSIZE // _MASK_BITS)
+
+# Loaded here, in the parent. Everything the child calls between fork
+# and exec must already be resolved: loading a library there (or
+# ctypes.util.find_library, which runs ldconfig) is not safe.
+# dlopen(NULL) gives the symbols of the running program, libc included.
+libc = ctypes.CDLL(None, use_errno=True)
+_sched_getaffinity = getattr(libc, 'sched_getaffinity', None)
+_sched_setaffinity = getattr(libc, 'sched_setaffinity', None)
+_syscall = getattr(libc, 'syscall', None)
+
+
+def is_int(value):
+    """True for ints and longs, but not bools.
+    """
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+def _raise_errno():
+    errno = ctypes.get_errno()
+    raise OSError(errno, os.strerror(errno))
+
+
+def available_cores():
+    """Returns the sorted list of cores this process may run on, which
+    honours the current affinity mask (e.g. a cgroup cpuset).
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+
+    mask = _CpuSet()
+    if (_sched_getaffinity is None or
+            _sched_getaffinity(0, ctypes.sizeof(mask), mask) != 0):
+        return range(multiprocessing.cpu_count())
+
+    return [core for core in range(CPU_SETSIZE)
+            if mask[core // _MASK_BITS] & (1 << (core % _MASK_BITS))]
+
+
+def check_cores(cores):
+    """Returns `cores` as a sorted list, or raises ValueError if they
+    can't go in an affinity mask.
+
+    :param cores: An iterable of core numbers, e.g: [2, 3]
+    """
+    if not hasattr(os, 'sched_setaffinity') and _sched_setaffinity is None:
+        raise ValueError('CPU affinity is not supported here')
+
+    try:
+        cores = sorted(set(cores))
+    except TypeError:
+        raise ValueError('cpu_affinity must be an iterable of cores, '
+                         'got {!r}'.format(cores))
+    if not cores:
+        raise ValueError('cpu_affinity needs at least one core')
+
+    for core in cores:
+        if not is_int(core):
+            raise ValueError('Invalid core: {!r}'.format(core))
+        if not 0 <= core < CPU_SETSIZE:
+            raise ValueError('Core {} is out of range (0-{})'.format(
+                core, CPU_SETSIZE - 1))
+
+    return cores
+
+
+def set_cpu_affinity(cores):
+    """Pins the calling process to `cores`, already checked by
+    `check_cores`.
+
+    :param cores: A list of core numbers, e.g: [2, 3]
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+        return
+
+    if _sched_setaffinity is None:
+        raise OSError('CPU affinity is not supported here')
+
+    mask = _CpuSet()
+    for core in cores:
+        mask[core // _MASK_BITS] |= 1 << (core % _MASK_BITS)
+
+    if _sched_setaffinity(0, ctypes.sizeof(mask), mask) != 0:
+        _raise_errno()
+
+
+def ioprio_value(ionice):
+    """Turns an ionice setting into the value ioprio_set expects.
+
+    :param ionice: A class name ('idle', 'best-effort', 'realtime')
+    or a (class name, level) tuple, e.g: ('best-effort', 7)
+    """
+    if isinstance(ionice, tuple):
+        ioclass, level = ionice
+    else:
+        ioclass, level = ionice, 0
+
+    if ioclass not in IOPRIO_CLASSES:
+        raise ValueError('Unknown ionice class: {}'.format(ioclass))
+    if not is_int(level) or not 0 <= level <= 7:
+        raise ValueError('ionice level must be 0-7, got {!r}'.format(level))
+
+    return (IOPRIO_CLASSES[ioclass] << IOPRIO_CLASS_SHIFT) | level
+
+
+def ioprio_syscall():
+    """Returns the ioprio_set syscall number for this machine, or raises
+    ValueError if we don't know it.
+    """
+    syscall = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if syscall is None or _syscall is None:
+        raise ValueError('ionice is not supported on {}'.format(
+            platform.machine()))
+    return syscall
+
+
+def set_ionice(syscall, value):
+    """Sets the I/O scheduling class of the calling process.
+
+    :param syscall: See `ioprio_syscall`.
+    :param value: See `ioprio_value`.
+    """
+    if _syscall(syscall, IOPRIO_WHO_PROCESS, 0, value) != 0:
+        _raise_errno()
+
+
+def rlimit_resource(name):
+    """Returns the resource.RLIMIT_* constant for `name`.
+
+    :param name: e.g: 'as', 'nofile', 'cpu' or one of `RLIMIT_ALIASES`.
+    """
+    name = RLIMIT_ALIASES.get(name, name)
+    try:
+        return getattr(resource, 'RLIMIT_' + name.upper())
+    except AttributeError:
+        raise ValueError('Unknown rlimit: {}'.format(name))
+
+
+def check_rlimits(rlimits):
+    """Returns `rlimits` as a list of (resource, (soft, hard)), or raises
+    ValueError if a name or a limit is not valid.
+
+    :param rlimits: A dict of name to limit. The limit is either a
+    number (soft and hard) or a (soft, hard) tuple, e.g:
+    {'as': 2 * 1024 ** 3, 'nofile': (256, 1024), 'cpu': 60}
+    """
+    checked = []
+    for name, limit in rlimits.items():
+        if not isinstance(limit, tuple):
+            limit = (limit, limit)
+
+        if len(limit) != 2 or not all(is_int(value) for value in limit):
+            raise ValueError(
+                'rlimit {} must be an int or a (soft, hard) tuple of '
+                'ints, got {!r}'.format(name, limit))
+
+        checked.append((rlimit_resource(name), limit))
+    return checked
+
+
+def set_rlimits(rlimits):
+    """Sets resource limits on the calling process.
+
+    :param rlimits: What `check_rlimits` returns.
+    """
+    for rlimit, limit in rlimits:
+        resource.setrlimit(rlimit, limit)
+
+
+class RoundRobinCores(object):
+    """Hands out cores one at a time, in turn, so batch jobs spread
+    across the machine. The first `reserve` cores are never handed out
+    and are left to the parent (and its reactor).
+
+        >>> cores = RoundRobinCores(reserve=1)
+        >>> d = gzip("big.log", _cpu_affinity=cores)
+    """
+    def __init__(self, cores=None, reserve=0, per_process=1):
+        """
+        :param cores: Cores to pick from. Defaults to `available_cores`.
+        :param reserve: How many cores to leave for the parent.
+        :param per_process: How many cores each process gets.
+        """
+        cores = list(cores) if cores is not None else available_cores()
+        self.reserved = cores[:reserve]
+        self.cores = cores[reserve:]
+        if not self.cores:
+            raise ValueError('No cores left after reserving {}'.format(
+                reserve))
+
+        self.per_process = min(per_process, len(self.cores))
+        self._cycle = itertools.cycle(self.cores)
+
+    def next(self):
+        """Returns the cores for the next process.
+        """
+        return [next(self._cycle) for _ in range(self.per_process)]
+
+
+class Placement(object):
+    """Where and how a spawned process runs: which cores, its nice and
+    ionice levels and its resource limits. Built in the parent, applied
+    in the child between fork and exec.
+    """
+    def __init__(self, cpu_affinity=None, nice=None, ionice=None,
+                 rlimits=None):
+        """
+        :param cpu_affinity: An iterable of cores or a `RoundRobinCores`.
+        :param nice: A niceness increment, e.g: 10
+        :param ionice: See `ioprio_value`.
+        :param rlimits: See `set_rlimits`.
+        """
+        if isinstance(cpu_affinity, RoundRobinCores):
+            # Resolved here, in the parent, so the pool keeps turning.
+            cpu_affinity = cpu_affinity.next()
+
+        self.cpu_affinity = cpu_affinity
+        self.nice = nice
+        self.ionice = ionice
+        self.rlimits = rlimits
+
+        # Everything is checked and worked out here, so that bad settings
+        # fail in the parent and the child has as little to do as possible.
+        self._cores = None
+        if cpu_affinity is not None:
+            self._cores = check_cores(cpu_affinity)
+
+        if nice is not None and not is_int(nice):
+            raise ValueError('nice must be an int, got {!r}'.format(nice))
+
+        self._ioprio = None
+        if ionice is not None:
+            self._ioprio = (ioprio_syscall(), ioprio_value(ionice))
+
+        self._rlimits = None
+        if rlimits is not None:
+            self._rlimits = check_rlimits(rlimits)
+
+    def __nonzero__(self):
+        return any(setting is not None for setting in
+                   [self.cpu_affinity, self.nice, self.ionice, self.rlimits])
+
+    __bool__ = __nonzero__
+
+    def apply(self):
+        """Applies the placement to the calling process.
+        """
+        if self._cores is not None:
+            set_cpu_affinity(self._cores)
+        if self.nice is not None:
+            os.nice(self.nice)
+        if self._ioprio is not None:
+            set_ionice(*self._ioprio)
+        if self._rlimits is not None:
+            set_rlimits(self._rlimits)
+
+
+class PlacedProcess(process.Process):
+    """A `twisted.internet.process.Process` which applies a `Placement`
+    in the child right before exec. If it fails, Twisted writes the
+    traceback to the child stderr and the process exits with 1.
+    """
+    def __init__(self, placement, *args, **kwargs):
+        # The fork happens in Process.__init__, so this goes first.
+        self.placement = placement
+        process.Process.__init__(self, *args, **kwargs)
+
+    def _trySpawnInsteadOfFork(self, *args, **kwargs):
+        # Newer Twisted may posix_spawn, which never calls _execChild.
+        return False
+
+    def _execChild(self, path, uid, gid, executable, args, environment):
+        self.placement.apply()
+        process.Process._execChild(
+            self, path, uid, gid, executable, args, environment)
+
+
+def spawnPlacedProcess(reactor, placement, protocol, executable, args,
+                       env=None):
+    """Like reactor.spawnProcess, but the process runs under `placement`.
+    POSIX only.
+    """
+    args, env = reactor._checkProcessArgs(args, env)
+    return PlacedProcess(
+        placement, reactor, executable, args, env, None, protocol,
+        None, None, None)
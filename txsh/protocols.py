@@ -5,6 +5,8 @@ from collections import namedtuple
 from twisted.python import log
 from twisted.internet import protocol, defer
 
+from buffers import PipeReader, CompressedBuffer, DecompressingProducer
+
 
 class DeferredProcess(defer.Deferred):
     """A specialized Deferred that adds a .signal method to a deferred.
@@ -30,7 +32,32 @@ class TxShProcessProtocol(protocol.ProcessProtocol):
     process when it's set to run. An instance of this is passed
     into reactor.spawnProcess.
     """
-    Output = namedtuple('Output', ['status', 'stdout', 'stderr'])
+    class Output(namedtuple('Output', ['status', 'stdout', 'stderr'])):
+        """What the process deferred fires with. `pipes` holds the
+        effective pipe settings per stream when pipe tuning was asked
+        for, or None otherwise. It is not one of the tuple fields, so
+        unpacking still gives (status, stdout, stderr), but it is kept
+        by `_make` and `_replace`.
+        """
+        def __new__(cls, status, stdout, stderr, pipes=None):
+            self = super(TxShProcessProtocol.Output, cls).__new__(
+                cls, status, stdout, stderr)
+            self.pipes = pipes
+            return self
+
+        @classmethod
+        def _make(cls, iterable, pipes=None):
+            return cls(*iterable, pipes=pipes)
+
+        def _replace(self, **kwargs):
+            pipes = kwargs.pop('pipes', self.pipes)
+            output = self._make(
+                [kwargs.pop(field, getattr(self, field))
+                 for field in self._fields], pipes=pipes)
+            if kwargs:
+                raise ValueError(
+                    'Got unexpected field names: {!r}'.format(kwargs.keys()))
+            return output
 
     def __init__(self, *args, **kwargs):
         """
@@ -40,12 +67,30 @@ class TxShProcessProtocol(protocol.ProcessProtocol):
         self._process_deferred = DeferredProcess(self)
         self._status = None
 
+        self._pipe_size = kwargs.get('pipe_size', None)
+        self._read_size = kwargs.get('read_size', None)
+        self._adaptive = kwargs.get('adaptive', False)
+        self._pipe_readers = {}
+
+        self._compress = kwargs.get('compress', None)
+        self._compress_level = kwargs.get('compress_level', None)
         self._stdout = kwargs.get('stdout', None)
         self._stderr = kwargs.get('stderr', None)
         if self._stdout is None:
-            self._stdout = []
+            self._stdout = self.make_capture()
         if self._stderr is None:
-            self._stderr = []
+            self._stderr = self.make_capture()
+
+    def make_capture(self):
+        """Returns what a stream is captured into when it is not
+        redirected: a list of chunks, or a `CompressedBuffer` if
+        compression was asked for.
+        """
+        if not self._compress:
+            return []
+
+        codec = 'zlib' if self._compress is True else self._compress
+        return CompressedBuffer(codec, self._compress_level)
 
     def write_stream(self, obj, data):
         """Writes stream to several types of object.
@@ -95,13 +140,49 @@ class TxShProcessProtocol(protocol.ProcessProtocol):
 
     def connectionMade(self):
         """This is called when the program is started.
-        So this is the place we write to the stdin, if needed.
+        So this is the place we write to the stdin, if needed, and
+        tune the output pipes.
         """
+        self.tune_pipes()
+
+        if isinstance(self._stdin, CompressedBuffer):
+            # Piped from a compressed capture. The transport pulls one
+            # decompressed chunk at a time and stdin is closed at the end.
+            DecompressingProducer(
+                self._stdin, self.transport,
+                done=self.transport.closeStdin).start()
+            return
+
         if self._stdin is not None:
             self.transport.write(self._stdin)
 
         self.transport.closeStdin()
 
+    def tune_pipes(self):
+        """Applies pipe_size, read_size and adaptive to the stdout and
+        stderr pipes. Does nothing if none of them were given.
+        """
+        if not (self._pipe_size or self._read_size or self._adaptive):
+            return
+
+        pipes = getattr(self.transport, 'pipes', {})
+        for name, child_fd in [('stdout', 1), ('stderr', 2)]:
+            reader = pipes.get(child_fd)
+            if reader is None:
+                continue
+            self._pipe_readers[name] = PipeReader(
+                reader, self._pipe_size, self._read_size, self._adaptive)
+
+    def get_pipe_settings(self):
+        """Returns the effective pipe settings per stream, or None
+        if the pipes were left alone.
+        """
+        if not self._pipe_readers:
+            return None
+
+        return dict((name, reader.settings())
+                    for name, reader in self._pipe_readers.items())
+
     def outConnectionLost(self):
         """This is called when the program closes its stdout pipe.
         This usually happens when the program terminates.
@@ -165,8 +246,10 @@ class TxShProcessProtocol(protocol.ProcessProtocol):
 
     def get_output(self, obj):
         """If stdout or stdout redirection is activated, this will
-        return none.
+        return none. A `CompressedBuffer` capture is returned as is.
         """
+        if isinstance(obj, CompressedBuffer):
+            return obj
 
         return ''.join(obj) if type(obj) is list else None
 
@@ -188,5 +271,6 @@ class TxShProcessProtocol(protocol.ProcessProtocol):
         stdout = self.get_output(self._stdout)
         stderr = self.get_output(self._stderr)
 
-        output = self.Output(self._status, stdout, stderr)
+        output = self.Output(
+            self._status, stdout, stderr, pipes=self.get_pipe_settings())
         self._process_deferred.callback(output)